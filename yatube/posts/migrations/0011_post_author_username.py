@@ -0,0 +1,18 @@
+# Generated by Django 2.2.16 on 2026-08-30 16:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0010_auto_20260830_1557'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='author_username',
+            field=models.CharField(blank=True, editable=False, help_text='Денормализованная копия username автора для лент', max_length=150, verbose_name='Имя автора'),
+        ),
+    ]
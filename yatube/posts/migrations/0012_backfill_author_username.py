@@ -0,0 +1,27 @@
+# Generated by Django 2.2.16 on 2026-08-30 16:05
+
+from django.db import migrations
+from django.db.models import OuterRef, Subquery
+
+
+def fill_author_username(apps, schema_editor):
+    Post = apps.get_model('posts', 'Post')
+    User = apps.get_model('auth', 'User')
+    Post.objects.update(author_username=Subquery(
+        User.objects.filter(pk=OuterRef('author_id')).values('username')[:1]))
+
+
+def clear_author_username(apps, schema_editor):
+    Post = apps.get_model('posts', 'Post')
+    Post.objects.update(author_username='')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0011_post_author_username'),
+    ]
+
+    operations = [
+        migrations.RunPython(fill_author_username, clear_author_username),
+    ]
@@ -31,9 +31,25 @@ class Post(CreatedModel):
         upload_to='posts/',
         blank=True
     )
+    author_username = models.CharField(
+        'Имя автора',
+        max_length=150,
+        blank=True,
+        editable=False,
+        help_text='Денормализованная копия username автора для лент'
+    )
 
     class Meta:
         ordering = ['-pub_date']
+        indexes = [
+            models.Index(fields=['-pub_date']),
+            models.Index(fields=['author', '-pub_date']),
+            models.Index(fields=['group', '-pub_date']),
+        ]
+
+    def save(self, *args, **kwargs):
+        self.author_username = self.author.username
+        super().save(*args, **kwargs)
 
     def __str__(self):
         return self.text[:15]
@@ -0,0 +1,29 @@
+from django.core.cache import cache
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import Follow, Post, User
+
+POSTS_VERSION_KEY = 'posts:ver'
+
+
+@receiver(post_save, sender=User)
+def sync_author_username(sender, instance, created, **kwargs):
+    """Поддерживает денормализованное имя автора на постах
+    при смене username."""
+    if not created:
+        (instance.posts
+         .exclude(author_username=instance.username)
+         .update(author_username=instance.username))
+
+
+@receiver(post_save, sender=Post)
+@receiver(post_save, sender=Follow)
+@receiver(post_delete, sender=Follow)
+def bump_posts_version(sender, **kwargs):
+    """Сбрасывает кеши лент (страницы главной, счетчики пагинатора)
+    при публикации поста или изменении подписок."""
+    try:
+        cache.incr(POSTS_VERSION_KEY)
+    except ValueError:
+        cache.set(POSTS_VERSION_KEY, 1, None)
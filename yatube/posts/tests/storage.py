@@ -0,0 +1,30 @@
+from django.core.files.base import ContentFile
+from django.core.files.storage import Storage
+from django.utils.deconstruct import deconstructible
+
+
+@deconstructible
+class InMemoryStorage(Storage):
+    """Хранилище для тестов: держит загруженные файлы в памяти,
+    чтобы не писать их на диск и не подчищать каталоги после."""
+
+    files = {}
+
+    def _open(self, name, mode='rb'):
+        return ContentFile(self.files[name], name=name)
+
+    def _save(self, name, content):
+        self.files[name] = content.read()
+        return name
+
+    def exists(self, name):
+        return name in self.files
+
+    def delete(self, name):
+        self.files.pop(name, None)
+
+    def size(self, name):
+        return len(self.files[name])
+
+    def url(self, name):
+        return f'/media/{name}'
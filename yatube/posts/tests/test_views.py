@@ -1,50 +1,69 @@
-import shutil
-import tempfile
-
 from django.contrib.auth import get_user_model
 from django.test import Client, TestCase, override_settings
 from django.urls import reverse
 from django import forms
 from django.core.files.uploadedfile import SimpleUploadedFile
-from django.conf import settings
 from django.core.cache import cache
 
 from posts.models import Post, Group, Follow
 
 User = get_user_model()
-TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+IN_MEMORY_STORAGE = 'posts.tests.storage.InMemoryStorage'
+SMALL_GIF_BYTES = (
+    b'\x47\x49\x46\x38\x39\x61\x02\x00'
+    b'\x01\x00\x80\x00\x00\x00\x00\x00'
+    b'\xFF\xFF\xFF\x21\xF9\x04\x00\x00'
+    b'\x00\x00\x00\x2C\x00\x00\x00\x00'
+    b'\x02\x00\x01\x00\x00\x02\x02\x0C'
+    b'\x0A\x00\x3B'
+)
+
+
+def make_upload(name='small.gif'):
+    return SimpleUploadedFile(name, SMALL_GIF_BYTES, 'image/gif')
+
 
+INDEX_URL = reverse('posts:index')
+POST_CREATE_URL = reverse('posts:post_create')
+FOLLOW_INDEX_URL = reverse('posts:follow_index')
+GROUP_LIST_URL = reverse('posts:group_list', kwargs={'slug': 'test-slug'})
+PROFILE_URL = reverse('posts:profile', kwargs={'username': 'auth'})
 
-@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
-class PostPageTests(TestCase):
+
+class BaseFixtureTestCase(TestCase):
+    """Общие фикстуры классов: автор, группа и клиенты создаются
+    один раз на класс, а не перед каждым тестом."""
     @classmethod
-    def setUpClass(cls):
-        super().setUpClass()
+    def setUpTestData(cls):
         cls.user = User.objects.create_user(username='auth')
         cls.group = Group.objects.create(
             title='Тестовая группа',
             slug='test-slug',
             description='Тестовое описание',
         )
-        small_gif = (
-            b'\x47\x49\x46\x38\x39\x61\x02\x00'
-            b'\x01\x00\x80\x00\x00\x00\x00\x00'
-            b'\xFF\xFF\xFF\x21\xF9\x04\x00\x00'
-            b'\x00\x00\x00\x2C\x00\x00\x00\x00'
-            b'\x02\x00\x01\x00\x00\x02\x02\x0C'
-            b'\x0A\x00\x3B'
-        )
-        uploaded = SimpleUploadedFile(
-            name='small.gif',
-            content=small_gif,
-            content_type='image/gif'
-        )
-        cls.post = Post.objects.create(
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.guest_client = Client()
+        cls.authorized_client = Client()
+        cls.authorized_client.force_login(cls.user)
+
+
+@override_settings(DEFAULT_FILE_STORAGE=IN_MEMORY_STORAGE)
+class PostPageTests(BaseFixtureTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.post = Post(
             author=cls.user,
             text='Тестовый пост длинной больше 15 символов',
             group=cls.group,
-            image=uploaded
         )
+        # Тестам класса нужна только непустая ссылка на картинку,
+        # поэтому путь записывается напрямую, минуя загрузку файла.
+        cls.post.image.name = 'posts/small.gif'
+        cls.post.save()
         cls.user2 = User.objects.create_user(username='auth2')
         cls.group2 = Group.objects.create(
             title='новая группа',
@@ -56,42 +75,39 @@ class PostPageTests(TestCase):
             text='Новый пост',
             group=cls.group2
         )
-
-    @classmethod
-    def tearDownClass(cls):
-        super().tearDownClass()
-        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
-
-    def setUp(self):
-        self.guest_client = Client()
-        self.authorized_client = Client()
-        self.authorized_client.force_login(self.user)
-        cache.clear()
+        cls.post_detail_url = reverse(
+            'posts:post_detail', kwargs={'post_id': cls.post.id})
+        cls.post_edit_url = reverse(
+            'posts:post_edit', kwargs={'post_id': cls.post.id})
+        cls.post2_detail_url = reverse(
+            'posts:post_detail', kwargs={'post_id': cls.post2.id})
+        cls.group2_list_url = reverse(
+            'posts:group_list', kwargs={'slug': cls.group2.slug})
+        cls.profile2_url = reverse(
+            'posts:profile', kwargs={'username': cls.user2.username})
+        cls.follow_user2_url = reverse(
+            'posts:profile_follow', kwargs={'username': cls.user2.username})
+        cls.unfollow_user2_url = reverse(
+            'posts:profile_unfollow', kwargs={'username': cls.user2.username})
+        cls.templates_pages_names = {
+            INDEX_URL: 'posts/index.html',
+            GROUP_LIST_URL: 'posts/group_list.html',
+            PROFILE_URL: 'posts/profile.html',
+            cls.post_detail_url: 'posts/post_detail.html',
+            POST_CREATE_URL: 'posts/post_create.html',
+            cls.post_edit_url: 'posts/post_create.html'
+        }
 
     def test_pages_uses_correct_template(self):
         """URL-адрес использует соответствующий шаблон."""
-        templates_pages_names = {
-            reverse('posts:index'): 'posts/index.html',
-            reverse('posts:group_list', kwargs={'slug': 'test-slug'}):
-            'posts/group_list.html',
-            reverse('posts:profile', kwargs={'username': 'auth'}):
-            'posts/profile.html',
-            reverse('posts:post_detail', kwargs={'post_id': self.post.id}):
-            'posts/post_detail.html',
-            reverse('posts:post_create'): 'posts/post_create.html',
-            reverse('posts:post_edit', kwargs={'post_id': self.post.id}):
-            'posts/post_create.html'
-        }
-        for reverse_name, template in templates_pages_names.items():
+        for reverse_name, template in self.templates_pages_names.items():
             with self.subTest(reverse_name=reverse_name):
                 response = self.authorized_client.get(reverse_name)
                 self.assertTemplateUsed(response, template)
 
     def test_post_detail_page_show_correct_context(self):
         """Шаблон post_detail сформирован с правильным контекстом."""
-        response = (self.authorized_client.get(reverse(
-            'posts:post_detail',
-            kwargs={'post_id': self.post.id})))
+        response = self.authorized_client.get(self.post_detail_url)
         self.assertEqual(response.context.get('post').text,
                          'Тестовый пост длинной больше 15 символов')
         self.assertEqual(response.context.get('post').author.username,
@@ -101,9 +117,15 @@ class PostPageTests(TestCase):
         self.assertEqual(response.context.get('post').image,
                          self.post.image)
 
+    def test_post_detail_page_uses_two_queries(self):
+        """Страница поста не делает запрос на каждый комментарий:
+        пост с join'ами, prefetch комментариев и подсчет постов автора."""
+        with self.assertNumQueries(3):
+            self.guest_client.get(self.post2_detail_url)
+
     def test_create_page_show_correct_context(self):
         """Шаблон post_create сформирован с правильным контекстом."""
-        response = self.authorized_client.get(reverse('posts:post_create'))
+        response = self.authorized_client.get(POST_CREATE_URL)
         form_fields = {
             'text': forms.fields.CharField,
             'group': forms.fields.ChoiceField,
@@ -116,8 +138,7 @@ class PostPageTests(TestCase):
 
     def test_edit_page_show_correct_context(self):
         """Шаблон post_edit сформирован с правильным контекстом."""
-        response = self.authorized_client.get(
-            reverse('posts:post_edit', kwargs={'post_id': self.post.id}))
+        response = self.authorized_client.get(self.post_edit_url)
         form_fields = {
             'text': forms.fields.CharField,
             'group': forms.fields.ChoiceField,
@@ -133,11 +154,7 @@ class PostPageTests(TestCase):
         self.assertEqual(post_id, self.post.id)
 
     def test_new_group_appears_in_right_pages(self):
-        page_names = [
-            reverse('posts:index'),
-            reverse('posts:group_list', kwargs={'slug': self.group2.slug}),
-            reverse('posts:profile', kwargs={'username': self.post2.author})
-        ]
+        page_names = [INDEX_URL, self.group2_list_url, self.profile2_url]
         for page_name in page_names:
             with self.subTest(page_name=page_name):
                 response = self.authorized_client.get(page_name)
@@ -145,31 +162,51 @@ class PostPageTests(TestCase):
                 self.assertIn(self.post2, posts)
 
     def test_group_list_does_not_contains_another_group(self):
-        response_another_group = self.authorized_client.get(
-            reverse('posts:group_list',
-                    kwargs={'slug': PostPageTests.group.slug}))
+        response_another_group = self.authorized_client.get(GROUP_LIST_URL)
         posts_another_group = response_another_group.context['page_obj']
         self.assertNotIn(self.post2, posts_another_group)
 
+    def test_index_page_uses_constant_number_of_queries(self):
+        """Число запросов на главной не растет с числом постов:
+        подсчет, выборка с join и запрос sorl-thumbnail для картинки."""
+        cache.clear()
+        with self.assertNumQueries(3):
+            self.guest_client.get(INDEX_URL)
+
+    def test_group_page_uses_constant_number_of_queries(self):
+        """Число запросов на странице группы не растет с числом постов:
+        группа, подсчет, выборка с join и запрос sorl-thumbnail."""
+        cache.clear()
+        with self.assertNumQueries(4):
+            self.guest_client.get(GROUP_LIST_URL)
+
+    def test_profile_page_uses_constant_number_of_queries(self):
+        """Число запросов в профиле не растет с числом постов: автор,
+        подсчет постов для шапки и пагинатора, выборка с join,
+        запрос sorl-thumbnail."""
+        cache.clear()
+        with self.assertNumQueries(5):
+            self.guest_client.get(PROFILE_URL)
+
     def test_cache_contains_index_page(self):
+        cache.clear()
         self.delete_post = Post.objects.create(
             author=self.user,
             text='Текст поста, который будет удален',
             group=self.group,
         )
-        response_before = self.guest_client.get(reverse('posts:index'))
+        response_before = self.guest_client.get(INDEX_URL)
         content_before = response_before.content
         post = Post.objects.get(id=self.delete_post.id)
         post.delete()
-        response_after = self.guest_client.get(reverse('posts:index'))
+        response_after = self.guest_client.get(INDEX_URL)
         content_after = response_after.content
         self.assertEqual(content_before, content_after)
 
     def test_authorized_client_can_follow(self):
         """Авторизованный пользователь может подписаться
         на другого пользователя"""
-        self.authorized_client.get(reverse(
-            'posts:profile_follow', kwargs={'username': self.user2.username}))
+        self.authorized_client.get(self.follow_user2_url)
         follow = Follow.objects.filter(author=self.user2, user=self.user)
         self.assertTrue(follow.exists())
 
@@ -178,12 +215,35 @@ class PostPageTests(TestCase):
         от другого пользователя"""
         follow, _ = Follow.objects.get_or_create(author=self.user2,
                                                  user=self.user)
-        self.authorized_client.get(reverse(
-            'posts:profile_unfollow', kwargs={'username':
-                                              self.user2.username}))
+        self.authorized_client.get(self.unfollow_user2_url)
         follow = Follow.objects.filter(author=self.user2, user=self.user)
         self.assertFalse(follow.exists())
 
+    def test_follow_index_keyset_page_shows_older_posts(self):
+        """Курсорная пагинация ленты отдает только посты
+        старее переданного курсора."""
+        Follow.objects.create(author=self.user2, user=self.user)
+        new_post = Post.objects.create(
+            author=self.user2,
+            text='Свежий пост'
+        )
+        response = self.authorized_client.get(
+            FOLLOW_INDEX_URL,
+            {'before_pub_date': new_post.pub_date.isoformat(),
+             'before_id': new_post.id})
+        posts = response.context['page_obj']
+        self.assertIn(self.post2, posts)
+        self.assertNotIn(new_post, posts)
+
+    def test_follow_index_invalid_cursor_falls_back_to_first_page(self):
+        """Испорченный курсор не роняет ленту, а отдает первую страницу."""
+        Follow.objects.create(author=self.user2, user=self.user)
+        response = self.authorized_client.get(
+            FOLLOW_INDEX_URL,
+            {'before_pub_date': 'garbage', 'before_id': 'garbage'})
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(self.post2, response.context['page_obj'])
+
     def test_new_following_visible_only_in_follower_feed(self):
         """В ленте пользователя появляются только посты авторов,
         на которых подписан"""
@@ -198,26 +258,18 @@ class PostPageTests(TestCase):
             author=self.user2,
             text='New post for follower'
         )
-        response = self.authorized_client.get(reverse
-                                              ('posts:follow_index'))
+        response = self.authorized_client.get(FOLLOW_INDEX_URL)
         posts = response.context['page_obj']
         self.assertIn(post, posts)
-        response = client_without_follow.get(reverse
-                                             ('posts:follow_index'))
+        response = client_without_follow.get(FOLLOW_INDEX_URL)
         posts = response.context['page_obj']
         self.assertNotIn(post, posts)
 
 
-class PostPaginatorTests(TestCase):
+class PostPaginatorTests(BaseFixtureTestCase):
     @classmethod
-    def setUpClass(cls):
-        super().setUpClass()
-        cls.user = User.objects.create_user(username='auth')
-        cls.group = Group.objects.create(
-            title='Тестовая группа',
-            slug='test-slug',
-            description='Тестовое описание',
-        )
+    def setUpTestData(cls):
+        super().setUpTestData()
         cls.post = Post.objects.create(
             author=cls.user,
             text='Тестовый пост длинной больше 15 символов',
@@ -229,24 +281,21 @@ class PostPaginatorTests(TestCase):
             slug='second-slug',
             description='описание второй группы',
         )
-        for i in range(12):
-            cls.post = Post.objects.create(
+        Post.objects.bulk_create(
+            Post(
                 author=cls.user2,
+                author_username=cls.user2.username,
                 text=str(i),
                 group=cls.group2
             )
+            for i in range(12)
+        )
         cls.page_names = [
-            reverse('posts:index'),
+            INDEX_URL,
             reverse('posts:group_list', kwargs={'slug': 'second-slug'}),
             reverse('posts:profile', kwargs={'username': 'auth2'})
         ]
 
-    def setUp(self):
-        self.guest_client = Client()
-        self.authorized_client = Client()
-        self.authorized_client.force_login(self.user)
-        cache.clear()
-
     def test_first_page_contains_ten_records(self):
         for page_name in PostPaginatorTests.page_names:
             with self.subTest(page_name=page_name):
@@ -254,62 +303,34 @@ class PostPaginatorTests(TestCase):
                 self.assertEqual(len(response.context['page_obj']), 10)
 
     def test_index_second_page_contains_three_records(self):
-        response = self.authorized_client.get(reverse('posts:index')
-                                              + '?page=2')
+        response = self.authorized_client.get(INDEX_URL + '?page=2')
         self.assertEqual(len(response.context['page_obj']), 3)
 
     def test_profile_and_group_list_second_page_contains_three_records(self):
         for page_name in PostPaginatorTests.page_names:
-            if page_name == reverse('posts:index'):
+            if page_name == INDEX_URL:
                 continue
             with self.subTest(page_name=page_name):
                 response = self.authorized_client.get(page_name + '?page=2')
                 self.assertEqual(len(response.context['page_obj']), 2)
 
 
-class PostFirstPostTests(TestCase):
+@override_settings(DEFAULT_FILE_STORAGE=IN_MEMORY_STORAGE)
+class PostFirstPostTests(BaseFixtureTestCase):
     @classmethod
-    def setUpClass(cls):
-        super().setUpClass()
-        cls.user = User.objects.create_user(username='auth')
-        cls.group = Group.objects.create(
-            title='Тестовая группа',
-            slug='test-slug',
-            description='Тестовое описание',
-        )
-        small_gif = (
-            b'\x47\x49\x46\x38\x39\x61\x02\x00'
-            b'\x01\x00\x80\x00\x00\x00\x00\x00'
-            b'\xFF\xFF\xFF\x21\xF9\x04\x00\x00'
-            b'\x00\x00\x00\x2C\x00\x00\x00\x00'
-            b'\x02\x00\x01\x00\x00\x02\x02\x0C'
-            b'\x0A\x00\x3B'
-        )
-        uploaded = SimpleUploadedFile(
-            name='small.gif',
-            content=small_gif,
-            content_type='image/gif'
-        )
+    def setUpTestData(cls):
+        super().setUpTestData()
         cls.post = Post.objects.create(
             author=cls.user,
             text='Тестовый пост длинной больше 15 символов',
             group=cls.group,
-            image=uploaded
+            image=make_upload()
         )
 
-    def setUp(self):
-        self.authorized_client = Client()
-        self.authorized_client.force_login(self.user)
-        cache.clear()
-
     def test_pages_with_multiple_posts_show_correct_context(self):
         """Шаблон index, group_list, profile
         сформирован с правильным контекстом."""
-        page_names = [
-            reverse('posts:index'),
-            reverse('posts:group_list', kwargs={'slug': 'test-slug'}),
-            reverse('posts:profile', kwargs={'username': 'auth'})
-        ]
+        page_names = [INDEX_URL, GROUP_LIST_URL, PROFILE_URL]
         for page_name in page_names:
             with self.subTest(page_name=page_name):
                 response = self.authorized_client.get(page_name)
@@ -325,11 +346,9 @@ class PostFirstPostTests(TestCase):
                                  'Тестовая группа')
                 self.assertEqual(task_image_0,
                                  self.post.image)
-                if page_name == reverse('posts:group_list',
-                                        kwargs={'slug': 'test-slug'}):
+                if page_name == GROUP_LIST_URL:
                     self.assertEqual(first_object.group,
                                      response.context['group'])
-                if page_name == reverse('posts:profile',
-                                        kwargs={'username': 'auth'}):
+                if page_name == PROFILE_URL:
                     self.assertEqual(first_object.author,
                                      response.context['author'])
@@ -1,28 +1,86 @@
+from hashlib import md5
+
+from django.core.cache import cache
 from django.core.paginator import Paginator
+from django.db.models import Exists, OuterRef, Prefetch, Q
+from django.http import Http404
 from django.shortcuts import render, get_object_or_404, redirect
 from django.urls import reverse
 from django.contrib.auth.decorators import login_required
-from django.views.decorators.cache import cache_page
+from django.utils.dateparse import parse_datetime
+from django.utils.functional import cached_property
+from django.views.decorators.cache import never_cache
+from django.views.decorators.vary import vary_on_cookie
 
-from .models import Post, Group, User, Follow
+from .models import Post, Group, User, Follow, Comment
 from .forms import PostForm, CommentForm
+from .signals import POSTS_VERSION_KEY
 
 
 NUMBER_OF_POSTS = 10
+INDEX_CACHE_TIMEOUT = 60
+COUNT_CACHE_TIMEOUT = 60
+
+
+class CachedCountPaginator(Paginator):
+    """Paginator, кеширующий SELECT COUNT(*) по тексту запроса,
+    чтобы не пересчитывать число постов на каждый запрос ленты."""
+
+    @cached_property
+    def count(self):
+        version = cache.get_or_set(POSTS_VERSION_KEY, 1, None)
+        key = 'count:v{}:{}'.format(
+            version,
+            md5(str(self.object_list.query).encode()).hexdigest())
+        return cache.get_or_set(
+            key, self.object_list.count, COUNT_CACHE_TIMEOUT)
+
+
+def parse_cursor(request):
+    """Возвращает курсор (before_pub_date, before_id) из query-параметров
+    или (None, None), если курсор отсутствует или испорчен."""
+    try:
+        before_pub_date = parse_datetime(
+            request.GET.get('before_pub_date', ''))
+        before_id = int(request.GET.get('before_id', ''))
+    except ValueError:
+        return None, None
+    if before_pub_date is None:
+        return None, None
+    return before_pub_date, before_id
+
+
+def keyset_page(post_list, before_pub_date, before_id,
+                limit=NUMBER_OF_POSTS):
+    """Страница ленты по ключу (pub_date, id) вместо OFFSET:
+    стоимость выборки не зависит от глубины страницы."""
+    posts = list(
+        post_list
+        .filter(Q(pub_date__lt=before_pub_date)
+                | Q(pub_date=before_pub_date, id__lt=before_id))
+        .order_by('-pub_date', '-id')[:limit + 1])
+    return posts[:limit], len(posts) > limit
 
 
 def get_paginator(request, post_list):
-    paginator = Paginator(post_list, NUMBER_OF_POSTS)
+    paginator = CachedCountPaginator(post_list, NUMBER_OF_POSTS)
     page_number = request.GET.get('page')
     page_obj = paginator.get_page(page_number)
     return page_obj
 
 
-@cache_page(20, key_prefix='index_page')
 def index(request):
     template = 'posts/index.html'
-    post_list = Post.objects.all()
+    post_list = Post.objects.select_related('author', 'group').only(
+        'text', 'pub_date', 'image', 'author_username',
+        'author__first_name', 'author__last_name', 'author__username',
+        'group__title', 'group__slug')
     page_obj = get_paginator(request, post_list)
+    version = cache.get_or_set(POSTS_VERSION_KEY, 1, None)
+    page_obj.object_list = cache.get_or_set(
+        f'index:v{version}:page{page_obj.number}',
+        lambda: list(page_obj.object_list),
+        INDEX_CACHE_TIMEOUT)
     context = {
         'page_obj': page_obj,
     }
@@ -32,35 +90,49 @@ def index(request):
 def group_posts(request, slug):
     template = 'posts/group_list.html'
     group = get_object_or_404(Group, slug=slug)
-    post_list = group.posts.all()
+    post_list = group.posts.select_related('author').only(
+        'text', 'pub_date', 'image', 'author_username', 'group',
+        'author__first_name', 'author__last_name', 'author__username')
     page_obj = get_paginator(request, post_list)
     context = {
         'group': group,
         'page_obj': page_obj,
+        'cache_version': cache.get_or_set(POSTS_VERSION_KEY, 1, None),
     }
     return render(request, template, context)
 
 
 def profile(request, username):
     template = 'posts/profile.html'
-    author = get_object_or_404(User, username=username)
-    post_list = author.posts.all()
+    authors = User.objects.all()
+    if request.user.is_authenticated:
+        authors = authors.annotate(
+            is_followed=Exists(Follow.objects.filter(
+                author=OuterRef('pk'), user=request.user)))
+    author = get_object_or_404(authors, username=username)
+    post_list = author.posts.select_related('group').only(
+        'text', 'pub_date', 'image', 'author_username', 'author',
+        'group__title', 'group__slug')
     page_obj = get_paginator(request, post_list)
-    following = False
-    if (request.user.is_authenticated
-       and Follow.objects.filter(author=author, user=request.user).exists()):
-        following = True
+    following = getattr(author, 'is_followed', False)
     context = {
         'author': author,
         'page_obj': page_obj,
-        'following': following
+        'following': following,
+        'cache_version': cache.get_or_set(POSTS_VERSION_KEY, 1, None),
     }
     return render(request, template, context)
 
 
-def post_detail(request, post_id, new_context={}):
+def post_detail(request, post_id):
     template = 'posts/post_detail.html'
-    post = get_object_or_404(Post, id=post_id)
+    post = get_object_or_404(
+        Post.objects
+        .select_related('author', 'group')
+        .prefetch_related(Prefetch(
+            'comments',
+            queryset=Comment.objects.select_related('author'))),
+        id=post_id)
     comments = post.comments.all()
     form = CommentForm()
     context = {
@@ -122,12 +194,31 @@ def add_comment(request, post_id):
 
 
 @login_required
+@vary_on_cookie
+@never_cache
 def follow_index(request):
     template = 'posts/follow.html'
-    post_list = Post.objects.filter(author__following__user=request.user)
-    page_obj = get_paginator(request, post_list)
+    post_list = (Post.objects
+                 .filter(author__following__user=request.user)
+                 .select_related('author', 'group')
+                 .only('text', 'pub_date', 'image', 'author_username',
+                       'author__first_name', 'author__last_name',
+                       'author__username',
+                       'group__title', 'group__slug'))
+    before_pub_date, before_id = parse_cursor(request)
+    next_cursor = None
+    if before_pub_date and before_id:
+        page_obj, has_more = keyset_page(
+            post_list, before_pub_date, before_id)
+        if has_more:
+            next_cursor = page_obj[-1]
+    else:
+        page_obj = get_paginator(request, post_list)
+        if page_obj.has_next():
+            next_cursor = page_obj[-1]
     context = {
         'page_obj': page_obj,
+        'next_cursor': next_cursor,
     }
     return render(request, template, context)
 
@@ -135,9 +226,8 @@ def follow_index(request):
 @login_required
 def profile_follow(request, username):
     author = get_object_or_404(User, username=username)
-    follow = Follow.objects.filter(user=request.user, author=author).exists()
-    if request.user.username != username and not follow:
-        Follow.objects.create(
+    if request.user.username != username:
+        Follow.objects.get_or_create(
             user=request.user,
             author=author
         )
@@ -146,7 +236,9 @@ def profile_follow(request, username):
 
 @login_required
 def profile_unfollow(request, username):
-    author = get_object_or_404(User, username=username)
-    unfollow = Follow.objects.filter(user=request.user, author=author)
-    unfollow.delete()
+    deleted, _ = (Follow.objects
+                  .filter(user=request.user, author__username=username)
+                  .delete())
+    if not deleted and not User.objects.filter(username=username).exists():
+        raise Http404
     return redirect('posts:profile', username=username)
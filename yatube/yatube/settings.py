@@ -11,6 +11,7 @@ https://docs.djangoproject.com/en/2.2/ref/settings/
 """
 
 import os
+import sys
 
 # Build paths inside the project like this: os.path.join(BASE_DIR, ...)
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
@@ -151,3 +152,8 @@ CACHES = {
         'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
     }
 }
+
+# В тестах медленный PBKDF2 не нужен: каждый create_user
+# тратит сотни миллисекунд только на хеширование пароля.
+if 'test' in sys.argv or 'pytest' in sys.argv[0]:
+    PASSWORD_HASHERS = ['django.contrib.auth.hashers.MD5PasswordHasher']